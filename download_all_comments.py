@@ -5,45 +5,86 @@ Reads post IDs from ../posts_with_comments.json and downloads comments
 from the Minecraft feedback API.
 
 Features:
+  - Streaming input: posts are read lazily with ijson, never all in memory
   - Batch processing: writes results to disk after each batch
-  - Resume support: checkpoint file tracks completed post IDs
-  - Rate limiting: configurable delays + exponential backoff on 403/429
-  - Per-post JSON files grouped into batch folders for easy management
+  - Resume support: append-only completed.log tracks completed post IDs and
+    a small summary file tracks counters; a post is only recorded once its
+    batch file is written, and both are saved every N posts (checked at
+    batch boundaries) and on exit (including Ctrl-C)
+  - Partial-failure resume: posts that fail part-way keep their fetched pages
+    (with ETags) and are retried on the next run, revalidating those pages
+    with If-None-Match so unchanged ones come back as a cheap 304
+  - Concurrency: asyncio + httpx (HTTP/2 when the server supports it),
+    worker count adapted with AIMD
+    (grows while latency is low, halves on 403/429, timeouts, connection
+    errors or slow responses)
+  - Rate limiting: global token-bucket limiter + exponential backoff on 403/429
+  - Per-post JSON records grouped into zstd-compressed batch files
   - Retries with backoff on transient errors
 
+Requires Python 3.9+ and the packages in requirements.txt:
+    pip install -r requirements.txt
+
 Usage:
     python download_all_comments.py
-    python download_all_comments.py --batch-size 50 --delay 0.5
+    python download_all_comments.py --batch-size 50 --rate 2 --period 1
+    python download_all_comments.py --c-min 2 --c-max 32 --latency-target 1.5
     python download_all_comments.py --reset  # clear checkpoint and restart
 """
 
 import argparse
+import asyncio
+import atexit
 import json
+import math
 import os
 import random
+import shutil
 import sys
 import time
+from collections import deque
 from datetime import datetime, timezone
 from pathlib import Path
 
-import requests
+import httpx
+import ijson
+import orjson
+import zstandard as zstd
+from aiolimiter import AsyncLimiter
+from tqdm import tqdm
 
 # ── Paths ──────────────────────────────────────────────────────────
 SCRIPT_DIR = Path(__file__).parent
 INPUT_FILE = SCRIPT_DIR / "posts_with_comments.json"
 OUTPUT_DIR = SCRIPT_DIR / "comments_data"
-CHECKPOINT_FILE = SCRIPT_DIR / "checkpoint.json"
+CHECKPOINT_FILE = SCRIPT_DIR / "checkpoint_summary.json"
+COMPLETED_LOG = SCRIPT_DIR / "completed.log"
+LEGACY_CHECKPOINT_FILE = SCRIPT_DIR / "checkpoint.json"
+PAGE_CURSORS_DIR = SCRIPT_DIR / "page_cursors"
 ERRORS_LOG = SCRIPT_DIR / "errors.log"
 
 # ── API Config ─────────────────────────────────────────────────────
 BASE_URL = "https://feedback.minecraft.net"
 PER_PAGE = 100
 TIMEOUT = 60
+# Only the post ID varies per post; bind .format once at import
+_URL_TEMPLATE = (
+    BASE_URL + "/api/v2/community/posts/{}/comments.json"
+    "?per_page=" + str(PER_PAGE) + "&sort_by=created_at&sort_order=asc"
+).format
+USER_AGENT = "MinecraftFeedbackResearch/1.0"
+
+# ── Output ─────────────────────────────────────────────────────────
+ZSTD_LEVEL = 3
 
 # ── Defaults (overridable via CLI args) ────────────────────────────
 DEFAULT_BATCH_SIZE = 25
-DEFAULT_DELAY = 0.4          # seconds between requests
-DEFAULT_BATCH_DELAY = 5.0    # seconds between batches
+DEFAULT_CHECKPOINT_EVERY = 25  # posts between checkpoint saves
+DEFAULT_RATE = 5             # requests allowed per period, across all workers
+DEFAULT_PERIOD = 1.0         # seconds
+DEFAULT_C_MIN = 2            # min posts downloaded in parallel
+DEFAULT_C_MAX = 32           # max posts downloaded in parallel
+DEFAULT_LATENCY_TARGET = 1.5 # seconds; slower responses shrink concurrency
 DEFAULT_MAX_RETRIES = 5
 DEFAULT_BACKOFF_BASE = 10    # initial backoff seconds on 403/429
 
@@ -52,32 +93,110 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Download comments for community posts")
     parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
                         help=f"Posts per batch (default: {DEFAULT_BATCH_SIZE})")
-    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY,
-                        help=f"Delay between API requests in seconds (default: {DEFAULT_DELAY})")
-    parser.add_argument("--batch-delay", type=float, default=DEFAULT_BATCH_DELAY,
-                        help=f"Delay between batches in seconds (default: {DEFAULT_BATCH_DELAY})")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help=f"Posts between checkpoint saves, checked when a batch is written "
+                             f"(default: {DEFAULT_CHECKPOINT_EVERY})")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help=f"Max API requests per period, shared by all workers; must be >= 1, "
+                             f"use --period to go slower (default: {DEFAULT_RATE})")
+    parser.add_argument("--period", type=float, default=DEFAULT_PERIOD,
+                        help=f"Rate limit window in seconds (default: {DEFAULT_PERIOD})")
+    parser.add_argument("--c-min", type=int, default=DEFAULT_C_MIN,
+                        help=f"Min posts downloaded in parallel (default: {DEFAULT_C_MIN})")
+    parser.add_argument("--c-max", type=int, default=DEFAULT_C_MAX,
+                        help=f"Max posts downloaded in parallel (default: {DEFAULT_C_MAX})")
+    parser.add_argument("--latency-target", type=float, default=DEFAULT_LATENCY_TARGET,
+                        help=f"Mean request latency in seconds above which concurrency "
+                             f"is halved (default: {DEFAULT_LATENCY_TARGET})")
     parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
                         help=f"Max retries per request (default: {DEFAULT_MAX_RETRIES})")
     parser.add_argument("--backoff-base", type=float, default=DEFAULT_BACKOFF_BASE,
                         help=f"Base backoff seconds for 403/429 (default: {DEFAULT_BACKOFF_BASE})")
     parser.add_argument("--reset", action="store_true",
                         help="Clear checkpoint and restart from scratch")
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    # AsyncLimiter can't hand out a whole token per request when the bucket
+    # holds less than one, so sub-1 rates must be expressed via --period
+    if args.rate < 1:
+        parser.error("--rate must be >= 1; for fewer requests use a longer "
+                     "--period (e.g. --rate 1 --period 2)")
+    if args.period <= 0:
+        parser.error("--period must be > 0")
+
+    # A limit of 0 would never admit a worker, and c_max also sizes the pool
+    if args.c_min < 1:
+        parser.error("--c-min must be >= 1")
+    if args.c_min > args.c_max:
+        parser.error("--c-min must not exceed --c-max")
+    if args.latency_target <= 0:
+        parser.error("--latency-target must be > 0")
+    return args
+
+
+# ── Input ──────────────────────────────────────────────────────────
+def count_input_posts(completed):
+    """Streaming pass over just the post IDs: (total posts, posts not yet completed)."""
+    total = remaining = 0
+    with open(INPUT_FILE, "rb") as f:
+        for post_id in ijson.items(f, "posts.item.post_id"):
+            total += 1
+            remaining += str(post_id) not in completed
+    return total, remaining
+
+
+def iter_remaining_posts(completed):
+    """Stream post records from the input file, skipping completed ones.
+
+    post_id is coerced to str once here, matching the IDs in the completed
+    set, so nothing downstream has to convert it again.
+    """
+    with open(INPUT_FILE, "rb") as f:
+        for post_info in ijson.items(f, "posts.item"):
+            post_id = str(post_info["post_id"])
+            if post_id not in completed:
+                yield {"post_id": post_id, "comment_count": post_info["comment_count"]}
 
 
 # ── Checkpoint ─────────────────────────────────────────────────────
+def migrate_legacy_checkpoint():
+    """Split an old single-file checkpoint.json into the summary + completed.log pair."""
+    with open(LEGACY_CHECKPOINT_FILE) as f:
+        legacy = json.load(f)
+    with open(COMPLETED_LOG, "w") as f:
+        f.writelines(f"{post_id}\n" for post_id in legacy["completed_post_ids"])
+    ckpt = {
+        "total_comments_downloaded": legacy["total_comments_downloaded"],
+        "last_updated": legacy["last_updated"],
+    }
+    with open(CHECKPOINT_FILE, "w") as f:
+        json.dump(ckpt, f, indent=2)
+    print(f"Migrated {LEGACY_CHECKPOINT_FILE.name} to {CHECKPOINT_FILE.name} + {COMPLETED_LOG.name}")
+
+
 def load_checkpoint():
+    """Return the summary counters and the set of completed post IDs."""
+    if not CHECKPOINT_FILE.exists() and LEGACY_CHECKPOINT_FILE.exists():
+        migrate_legacy_checkpoint()
+
+    ckpt = {"total_comments_downloaded": 0, "last_updated": None}
     if CHECKPOINT_FILE.exists():
         with open(CHECKPOINT_FILE) as f:
-            return json.load(f)
-    return {
-        "completed_post_ids": [],
-        "total_comments_downloaded": 0,
-        "last_updated": None,
-    }
+            ckpt.update(json.load(f))
+
+    completed = set()
+    if COMPLETED_LOG.exists():
+        with open(COMPLETED_LOG) as f:
+            completed = {line.strip() for line in f if line.strip()}
 
+    return ckpt, completed
+
+
+def save_checkpoint(ckpt, completed_log, new_post_ids):
+    """Append newly completed IDs to the open log, then rewrite the small summary."""
+    completed_log.write("".join(f"{post_id}\n" for post_id in new_post_ids))
+    completed_log.flush()
 
-def save_checkpoint(ckpt):
     ckpt["last_updated"] = datetime.now(timezone.utc).isoformat()
     tmp = CHECKPOINT_FILE.with_suffix(".tmp")
     with open(tmp, "w") as f:
@@ -85,123 +204,332 @@ def save_checkpoint(ckpt):
     tmp.rename(CHECKPOINT_FILE)
 
 
+def list_page_cursors():
+    """IDs of posts that have a saved page cursor."""
+    return {path.stem for path in PAGE_CURSORS_DIR.glob("*.json")}
+
+
+def load_page_cursor(post_id):
+    """Pages already fetched for a post that failed part-way."""
+    return orjson.loads((PAGE_CURSORS_DIR / f"{post_id}.json").read_bytes())
+
+
+def save_page_cursor(post_id, pages):
+    """One file per post, so a failure only ever rewrites its own cursor."""
+    PAGE_CURSORS_DIR.mkdir(parents=True, exist_ok=True)
+    path = PAGE_CURSORS_DIR / f"{post_id}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(orjson.dumps(pages))
+    tmp.rename(path)
+
+
+def drop_page_cursor(post_id):
+    (PAGE_CURSORS_DIR / f"{post_id}.json").unlink(missing_ok=True)
+
+
 def reset_checkpoint():
-    if CHECKPOINT_FILE.exists():
-        CHECKPOINT_FILE.unlink()
+    cleared = False
+    for path in (CHECKPOINT_FILE, COMPLETED_LOG, LEGACY_CHECKPOINT_FILE):
+        if path.exists():
+            path.unlink()
+            cleared = True
+    if PAGE_CURSORS_DIR.exists():
+        shutil.rmtree(PAGE_CURSORS_DIR)
+        cleared = True
+    if cleared:
         print("Checkpoint cleared.")
 
 
 # ── Error logging ──────────────────────────────────────────────────
+_errors_fp = None
+
+
 def log_error(post_id, error_msg):
+    # Opened on first error and kept open (line-buffered) for the rest of the run
+    global _errors_fp
+    if _errors_fp is None:
+        _errors_fp = open(ERRORS_LOG, "a", buffering=1)
+        atexit.register(_errors_fp.close)
     timestamp = datetime.now(timezone.utc).isoformat()
-    with open(ERRORS_LOG, "a") as f:
-        f.write(f"[{timestamp}] post_id={post_id} | {error_msg}\n")
+    _errors_fp.write(f"[{timestamp}] post_id={post_id} | {error_msg}\n")
+
+
+# ── Concurrency control ────────────────────────────────────────────
+class AIMDController:
+    """Dynamic concurrency limit with additive increase / multiplicative decrease.
+
+    Used as `async with controller:` around each post. Every request reports
+    its latency and whether it signalled overload (403/429, timeout or
+    connection error) via record(); every `adjust_every` requests the limit
+    grows by one if the window was clean and fast, or halves on any overload
+    or a mean latency above the target.
+    """
+
+    def __init__(self, c_min, c_max, latency_target, window=50, adjust_every=10):
+        self.c_min = c_min
+        self.c_max = c_max
+        self.latency_target = latency_target
+        self.limit = c_min
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.adjust_every = adjust_every
+        self.since_adjust = 0
+        self.overloaded = 0
+        self.slot_free = asyncio.Event()
+        self.slot_free.set()
+
+    async def __aenter__(self):
+        while self.in_flight >= self.limit:
+            self.slot_free.clear()
+            await self.slot_free.wait()
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        if self.in_flight < self.limit:
+            self.slot_free.set()
+
+    def record(self, latency, overloaded):
+        self.latencies.append(latency)
+        self.overloaded += overloaded
+        self.since_adjust += 1
+        if self.since_adjust < self.adjust_every:
+            return
+
+        mean_latency = sum(self.latencies) / len(self.latencies)
+        if self.overloaded or mean_latency > self.latency_target:
+            self.limit = max(self.c_min, self.limit // 2)
+        else:
+            self.limit = min(self.c_max, self.limit + 1)
+            if self.in_flight < self.limit:
+                self.slot_free.set()
+        self.since_adjust = 0
+        self.overloaded = 0
 
 
 # ── API ────────────────────────────────────────────────────────────
-def download_comments_for_post(post_id, delay, max_retries, backoff_base):
-    """Download all comments for a single post with pagination and retries."""
-    url = (
-        f"{BASE_URL}/api/v2/community/posts/{post_id}/comments.json"
-        f"?per_page={PER_PAGE}&sort_by=created_at&sort_order=asc"
+def create_client(max_connections):
+    """One shared client for the whole run; every request hits the same host.
+
+    HTTP/2 multiplexes concurrent requests over a single connection; if the
+    server only speaks HTTP/1.1 httpx falls back to a keep-alive pool.
+    The client does not retry on its own: connect failures, timeouts and
+    bad status codes are all retried in one place, the per-page loop in
+    download_comments_for_post.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections),
+        timeout=TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
     )
+
+
+def parse_seconds(value):
+    """Header value as a finite float, or None."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if math.isfinite(seconds) else None
+
+
+def server_requested_wait(headers, max_wait):
+    """Seconds the server asked us to wait via Retry-After / x-ratelimit-reset, or None.
+
+    The result is clamped to max_wait, so a bogus header can never stall a
+    worker indefinitely.
+    """
+    wait = parse_seconds(headers.get("Retry-After"))
+    if wait is None:
+        wait = parse_seconds(headers.get("x-ratelimit-reset") or headers.get("X-Rate-Limit-Reset"))
+        # Some APIs send an epoch timestamp (seconds or milliseconds),
+        # others a delta in seconds
+        if wait is not None and wait > 1e12:
+            wait = wait / 1000 - time.time()
+        elif wait is not None and wait > 1e9:
+            wait -= time.time()
+
+    if wait is None:
+        return None
+    return min(max(0.0, wait), max_wait)
+
+
+async def download_comments_for_post(client, limiter, controller, post_id, max_retries, backoff_base,
+                                     cached_pages=None):
+    """Download all comments for a single post with pagination and retries.
+
+    Returns (comments, status, pages), where pages holds url/etag/next_page/
+    comments for every page fetched. Passing a previous run's pages as
+    cached_pages revalidates them with If-None-Match and reuses them on 304.
+    On failure, cached pages this attempt never reached are carried over, so
+    a retry never ends up with less data than an earlier run.
+    """
+    url = _URL_TEMPLATE(post_id)
+    cache = {p["url"]: p for p in cached_pages or []}
     all_comments = []
+    seen_ids = set()
+    pages = []
     page = 0
 
+    def add_page(page_data):
+        pages.append(page_data)
+        # Pages can overlap when new comments shift the boundaries
+        # mid-scrape; keep the first copy of each comment
+        for comment in page_data["comments"]:
+            if comment["id"] not in seen_ids:
+                seen_ids.add(comment["id"])
+                all_comments.append(comment)
+
     while url:
         page += 1
         success = False
+        reason = None
+        cached = cache.get(url)
+        headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else None
 
         for attempt in range(1, max_retries + 1):
+            await limiter.acquire()
+            started = time.monotonic()
             try:
-                resp = requests.get(url, timeout=TIMEOUT, headers={
-                    "User-Agent": "MinecraftFeedbackResearch/1.0"
-                })
-
-                if resp.status_code == 200:
-                    data = resp.json()
-                    comments = data.get("comments", [])
-                    all_comments.extend(comments)
-                    url = data.get("next_page")
+                resp = await client.get(url, headers=headers)
+                controller.record(time.monotonic() - started, resp.status_code in (403, 429))
+
+                if resp.status_code == 200 or (resp.status_code == 304 and cached):
+                    if resp.status_code == 304:
+                        # Unchanged since the previous run — reuse the cached page
+                        page_data = cached
+                    else:
+                        data = resp.json()
+                        page_data = {
+                            "url": url,
+                            "etag": resp.headers.get("ETag"),
+                            "next_page": data.get("next_page"),
+                            "comments": data.get("comments", []),
+                        }
+                    add_page(page_data)
+                    url = page_data["next_page"]
                     success = True
                     break
 
                 elif resp.status_code in (403, 429):
-                    # Rate limited — backoff with jitter
-                    wait = backoff_base * (2 ** (attempt - 1)) + random.uniform(0, 3)
-                    print(f"    [{resp.status_code}] post {post_id} page {page}, "
-                          f"attempt {attempt}/{max_retries}, waiting {wait:.1f}s...")
-                    time.sleep(wait)
+                    # Rate limited — honor the server's cooldown if it sent one,
+                    # otherwise backoff with jitter
+                    server_wait = server_requested_wait(resp.headers,
+                                                        backoff_base * 2 ** max_retries)
+                    if server_wait is not None:
+                        wait = server_wait + random.uniform(0, 1)
+                    else:
+                        wait = backoff_base * (2 ** (attempt - 1)) + random.uniform(0, 3)
 
                 elif resp.status_code == 404:
                     # Post deleted or doesn't exist — skip
-                    print(f"    [404] post {post_id} not found, skipping.")
-                    return all_comments, "404_not_found"
+                    tqdm.write(f"    [404] post {post_id} not found, skipping.")
+                    return all_comments, "404_not_found", pages
 
                 else:
                     wait = backoff_base * attempt + random.uniform(0, 2)
-                    print(f"    [{resp.status_code}] post {post_id} page {page}, "
-                          f"attempt {attempt}/{max_retries}, waiting {wait:.1f}s...")
-                    time.sleep(wait)
+                reason = resp.status_code
 
-            except requests.exceptions.Timeout:
-                wait = backoff_base * attempt
-                print(f"    [TIMEOUT] post {post_id} page {page}, "
-                      f"attempt {attempt}/{max_retries}, waiting {wait:.1f}s...")
-                time.sleep(wait)
+            except httpx.TimeoutException:
+                # Timeouts and dropped connections are the strongest overload
+                # signal, so they shrink concurrency just like a 429 does
+                controller.record(time.monotonic() - started, True)
+                reason, wait = "TIMEOUT", backoff_base * attempt
 
-            except requests.exceptions.ConnectionError:
+            except httpx.TransportError:
+                controller.record(time.monotonic() - started, True)
+                reason = "CONN ERROR"
                 wait = backoff_base * (2 ** (attempt - 1)) + random.uniform(0, 5)
-                print(f"    [CONN ERROR] post {post_id} page {page}, "
-                      f"attempt {attempt}/{max_retries}, waiting {wait:.1f}s...")
-                time.sleep(wait)
 
             except Exception as e:
-                print(f"    [ERROR] post {post_id} page {page}: {e}")
-                time.sleep(backoff_base)
+                reason, wait = f"ERROR: {e}", backoff_base
+
+            # No point sleeping after the final attempt
+            if attempt == max_retries:
+                break
+            tqdm.write(f"    [{reason}] post {post_id} page {page}, "
+                       f"attempt {attempt}/{max_retries}, waiting {wait:.1f}s...")
+            await asyncio.sleep(wait)
 
         if not success:
-            error_msg = f"Failed after {max_retries} attempts on page {page}"
+            error_msg = f"Failed after {max_retries} attempts on page {page} (last: {reason})"
             log_error(post_id, error_msg)
-            return all_comments, f"failed_page_{page}"
-
-        # Delay between pagination requests
-        if url:
-            time.sleep(delay)
+            fetched_urls = {p["url"] for p in pages}
+            for cached_page in cached_pages or []:
+                if cached_page["url"] not in fetched_urls:
+                    add_page(cached_page)
+            return all_comments, f"failed_page_{page}", pages
 
-    return all_comments, "ok"
+    return all_comments, "ok", pages
 
 
 # ── Batch processing ──────────────────────────────────────────────
 def save_batch(batch_results, batch_num):
-    """Save a batch of post comments to a JSON file."""
+    """Save a batch of post comments to a zstd-compressed JSON file."""
     batch_dir = OUTPUT_DIR / "batches"
     batch_dir.mkdir(parents=True, exist_ok=True)
-    batch_file = batch_dir / f"batch_{batch_num:05d}.json"
+    batch_file = batch_dir / f"batch_{batch_num:05d}.json.zst"
+    cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    batch_file.write_bytes(cctx.compress(orjson.dumps(batch_results)))
+    return batch_file
 
-    with open(batch_file, "w", encoding="utf-8") as f:
-        json.dump(batch_results, f, indent=2, ensure_ascii=False)
 
-    return batch_file
+def next_batch_num():
+    """Number after the highest existing batch file, so earlier batches are never overwritten."""
+    batch_nums = [
+        int(bf.name.split(".")[0].removeprefix("batch_"))
+        for bf in (OUTPUT_DIR / "batches").glob("batch_*.json*")
+    ]
+    return max(batch_nums, default=0) + 1
 
 
-def print_progress(done_count, total, batch_comments, total_comments, errors_count, elapsed):
-    pct = (done_count / total * 100) if total else 0
-    rate = done_count / elapsed if elapsed > 0 else 0
-    eta_secs = (total - done_count) / rate if rate > 0 else 0
-    eta_mins = eta_secs / 60
+# ── Main ───────────────────────────────────────────────────────────
+async def bounded_download(controller, client, limiter, cursor_ids, post_info, args):
+    """Download one post's comments once a concurrency slot is free."""
+    post_id = post_info["post_id"]
+    async with controller:
+        comments, status, pages = await download_comments_for_post(
+            client, limiter, controller, post_id, args.max_retries, args.backoff_base,
+            cached_pages=load_page_cursor(post_id) if post_id in cursor_ids else None
+        )
+    return post_info, comments, status, pages
+
+
+async def stream_downloads(posts, controller, client, limiter, cursor_ids, args):
+    """Yield (post_info, comments, status, pages) for each post as its download finishes.
+
+    Only a small window of tasks is scheduled ahead of the controller's
+    limit, so the input iterator is consumed lazily.
+    """
+    posts = iter(posts)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < 2 * args.c_max:
+                post_info = next(posts, None)
+                if post_info is None:
+                    break
+                pending.add(asyncio.create_task(
+                    bounded_download(controller, client, limiter, cursor_ids, post_info, args)
+                ))
+            if not pending:
+                return
 
-    print(f"\r  Progress: {done_count:,}/{total:,} posts ({pct:.1f}%) | "
-          f"Batch comments: {batch_comments:,} | "
-          f"Total comments: {total_comments:,} | "
-          f"Errors: {errors_count} | "
-          f"ETA: {eta_mins:.0f} min", end="", flush=True)
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
 
 
-# ── Main ───────────────────────────────────────────────────────────
 def main():
-    args = parse_args()
+    asyncio.run(run(parse_args()))
+
 
+async def run(args):
     if args.reset:
         reset_checkpoint()
 
@@ -211,23 +539,18 @@ def main():
         print("Run the post ID extraction script first to create posts_with_comments.json")
         sys.exit(1)
 
-    with open(INPUT_FILE) as f:
-        input_data = json.load(f)
-
-    all_posts = input_data["posts"]
-    print(f"Loaded {len(all_posts):,} posts from {INPUT_FILE.name}")
-
     # Load checkpoint
-    ckpt = load_checkpoint()
-    completed = set(ckpt["completed_post_ids"])
+    ckpt, completed = load_checkpoint()
+    cursor_ids = list_page_cursors()
     total_comments = ckpt["total_comments_downloaded"]
 
-    # Filter remaining
-    remaining = [p for p in all_posts if str(p["post_id"]) not in completed]
+    # Count posts without materializing them; records are streamed later
+    total_posts, remaining_count = count_input_posts(completed)
+    print(f"Found {total_posts:,} posts in {INPUT_FILE.name}")
     print(f"Already completed: {len(completed):,}")
-    print(f"Remaining:         {len(remaining):,}")
+    print(f"Remaining:         {remaining_count:,}")
 
-    if not remaining:
+    if not remaining_count:
         print("All posts already downloaded!")
         return
 
@@ -235,68 +558,96 @@ def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     # Calculate starting batch number
-    batch_num = len(completed) // args.batch_size + 1
+    batch_num = next_batch_num()
     errors_count = 0
     start_time = time.time()
 
     print(f"\nStarting download with batch_size={args.batch_size}, "
-          f"delay={args.delay}s, batch_delay={args.batch_delay}s\n")
-
-    # Process in batches
-    for batch_start in range(0, len(remaining), args.batch_size):
-        batch = remaining[batch_start:batch_start + args.batch_size]
-        batch_results = []
-        batch_comments = 0
-
-        print(f"Batch {batch_num} ({len(batch)} posts):")
-
-        for post_info in batch:
-            post_id = str(post_info["post_id"])
-            expected_comments = post_info["comment_count"]
-
-            comments, status = download_comments_for_post(
-                post_id, args.delay, args.max_retries, args.backoff_base
-            )
-
-            batch_results.append({
-                "post_id": int(post_id),
-                "expected_comment_count": expected_comments,
-                "actual_comment_count": len(comments),
-                "status": status,
-                "comments": comments,
-            })
-
-            batch_comments += len(comments)
-            total_comments += len(comments)
-
-            # Update checkpoint immediately per post
-            completed.add(post_id)
-            ckpt["completed_post_ids"] = list(completed)
-            ckpt["total_comments_downloaded"] = total_comments
-            save_checkpoint(ckpt)
-
-            if status != "ok" and status != "404_not_found":
-                errors_count += 1
-
-            elapsed = time.time() - start_time
-            print_progress(len(completed), len(all_posts),
-                           batch_comments, total_comments, errors_count, elapsed)
-
-            # Delay between posts
-            time.sleep(args.delay + random.uniform(0, 0.2))
-
-        # Save batch to disk
-        batch_file = save_batch(batch_results, batch_num)
-        print(f"\n  -> Saved {batch_file.name} "
-              f"({batch_comments:,} comments from {len(batch)} posts)")
+          f"rate={args.rate}/{args.period}s, concurrency={args.c_min}..{args.c_max}\n")
+
+    controller = AIMDController(args.c_min, args.c_max, args.latency_target)
+    limiter = AsyncLimiter(args.rate, args.period)
+    batch_results = []
+    batch_comments = 0
+
+    # Posts only become eligible for completed.log once their batch file is
+    # on disk; until then they sit in batch_done_ids / batch_done_comments.
+    batch_done_ids = []
+    batch_done_comments = 0
+    unsaved_ids = []
+    completed_log = open(COMPLETED_LOG, "a", buffering=1)
+    pbar = tqdm(total=total_posts, initial=len(completed), unit="posts", smoothing=0.1)
+
+    try:
+        async with create_client(args.c_max) as client:
+            downloads = stream_downloads(iter_remaining_posts(completed),
+                                         controller, client, limiter, cursor_ids, args)
+
+            # Posts finish out of order and are grouped into batch files of
+            # batch_size in completion order.
+            async for post_info, comments, status, pages in downloads:
+                post_id = post_info["post_id"]
+
+                batch_results.append({
+                    "post_id": int(post_id),
+                    "expected_comment_count": post_info["comment_count"],
+                    "actual_comment_count": len(comments),
+                    "status": status,
+                    "comments": comments,
+                })
 
-        batch_num += 1
+                batch_comments += len(comments)
+                completed.add(post_id)
 
-        # Longer pause between batches
-        if batch_start + args.batch_size < len(remaining):
-            jitter = random.uniform(0, 2)
-            print(f"  Pausing {args.batch_delay + jitter:.1f}s before next batch...\n")
-            time.sleep(args.batch_delay + jitter)
+                if status.startswith("failed_"):
+                    # Leave it out of the completed log (and the comment total)
+                    # so the next run retries it from the pages fetched so far
+                    errors_count += 1
+                    save_page_cursor(post_id, pages)
+                    cursor_ids.add(post_id)
+                else:
+                    total_comments += len(comments)
+                    batch_done_ids.append(post_id)
+                    batch_done_comments += len(comments)
+                    if post_id in cursor_ids:
+                        drop_page_cursor(post_id)
+                        cursor_ids.discard(post_id)
+
+                pbar.update(1)
+                pbar.set_postfix(comments=total_comments, errors=errors_count,
+                                 workers=controller.limit, refresh=False)
+
+                # Save batch to disk
+                if len(batch_results) == args.batch_size:
+                    batch_file = save_batch(batch_results, batch_num)
+                    tqdm.write(f"  -> Saved {batch_file.name} "
+                              f"({batch_comments:,} comments from {len(batch_results)} posts)")
+
+                    batch_num += 1
+                    batch_results = []
+                    batch_comments = 0
+                    unsaved_ids.extend(batch_done_ids)
+                    ckpt["total_comments_downloaded"] += batch_done_comments
+                    batch_done_ids = []
+                    batch_done_comments = 0
+
+                    # Checkpoint once at least N saved posts are unrecorded
+                    if len(unsaved_ids) >= args.checkpoint_every:
+                        save_checkpoint(ckpt, completed_log, unsaved_ids)
+                        unsaved_ids = []
+    finally:
+        # Runs on normal completion, errors and Ctrl-C alike: flush the
+        # partial batch before the checkpoint that marks its posts done.
+        pbar.close()
+        if batch_results:
+            batch_file = save_batch(batch_results, batch_num)
+            print(f"  -> Saved {batch_file.name} "
+                  f"({batch_comments:,} comments from {len(batch_results)} posts)")
+            unsaved_ids.extend(batch_done_ids)
+            ckpt["total_comments_downloaded"] += batch_done_comments
+        if unsaved_ids:
+            save_checkpoint(ckpt, completed_log, unsaved_ids)
+        completed_log.close()
 
     # Final summary
     elapsed = time.time() - start_time
@@ -309,6 +660,7 @@ def main():
     print(f"  Time elapsed:             {elapsed / 60:.1f} minutes")
     print(f"  Output directory:         {OUTPUT_DIR}")
     print(f"  Checkpoint:               {CHECKPOINT_FILE}")
+    print(f"  Completed log:            {COMPLETED_LOG}")
     if errors_count > 0:
         print(f"  Error log:                {ERRORS_LOG}")
 
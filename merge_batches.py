@@ -4,64 +4,170 @@ Merge all batch JSON files into a single consolidated output file.
 Run this after download_all_comments.py finishes (or at any point to get
 a snapshot of what's been downloaded so far).
 
+Reads both zstd-compressed (batch_*.json.zst) and older plain
+(batch_*.json) batch files, so mixed directories merge fine.
+
+Batch files are decoded in parallel by a process pool; each worker hands
+back the already re-encoded posts, which the main process streams straight
+to the output. Only about two batches per worker are in flight at once, so
+memory use does not grow with the size of the dataset. The default output
+is JSON Lines (one post per line) plus a small summary file with the
+totals; --format json writes a single JSON document instead.
+
+A post that failed part-way is retried on a later run and appears again in
+a newer batch. A quick first pass over the post IDs finds the newest batch
+holding each post; the second pass then writes posts in batch order, keeping
+only that newest record.
+
+Requires Python 3.9+ and the packages in requirements.txt:
+    pip install -r requirements.txt
+
 Usage:
     python merge_batches.py
-    python merge_batches.py --output my_comments.json
+    python merge_batches.py --output my_comments.jsonl
+    python merge_batches.py --format json
+    python merge_batches.py --workers 4
 """
 
 import argparse
 import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import orjson
+import zstandard as zstd
+
 SCRIPT_DIR = Path(__file__).parent
-BATCH_DIR = SCRIPT_DIR / "comments_data" / "batches"
-DEFAULT_OUTPUT = SCRIPT_DIR / "comments_data" / "all_comments.json"
+OUTPUT_DIR = SCRIPT_DIR / "comments_data"
+BATCH_DIR = OUTPUT_DIR / "batches"
+DEFAULT_FORMAT = "jsonl"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def read_batch(path):
+    """Decode one batch file, decompressing it first if it is zstd."""
+    raw = path.read_bytes()
+    if raw.startswith(ZSTD_MAGIC):
+        raw = zstd.ZstdDecompressor().decompress(raw)
+    return orjson.loads(raw)
+
+
+def encode_batch(path):
+    """Worker: decode a batch and return (post_id, status, comment count, encoded post) per post.
+
+    Posts come back already serialized so only bytes cross the process
+    boundary, not nested dicts.
+    """
+    return [
+        (post["post_id"], post["status"], post["actual_comment_count"], orjson.dumps(post))
+        for post in read_batch(path)
+    ]
+
+
+def read_post_ids(path):
+    """Worker: just the post IDs in a batch, for the dedup pass."""
+    return [post["post_id"] for post in read_batch(path)]
+
+
+def iter_batches(ex, fn, batch_files, window):
+    """Yield fn(batch_file) results in file order with at most `window` batches in flight.
+
+    Unlike ex.map, which submits everything up front, this keeps workers from
+    running far ahead of the writer and buffering the whole dataset.
+    """
+    pending = deque()
+    for bf in batch_files:
+        pending.append(ex.submit(fn, bf))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def summary_path(output_path):
+    """Sidecar file holding the totals for a JSONL output."""
+    return output_path.with_name(f"{output_path.stem}_summary.json")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Merge batch files into one JSON")
-    parser.add_argument("--output", type=str, default=str(DEFAULT_OUTPUT),
-                        help=f"Output file path (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--format", choices=("jsonl", "json"), default=DEFAULT_FORMAT,
+                        help=f"jsonl: one post per line + summary file; "
+                             f"json: single document (default: {DEFAULT_FORMAT})")
+    parser.add_argument("--output", type=str, default=None,
+                        help=f"Output file path (default: {OUTPUT_DIR / 'all_comments'}.<format>)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to decode batch files (default: CPU count)")
     args = parser.parse_args()
 
     if not BATCH_DIR.exists():
         print(f"No batch directory found at {BATCH_DIR}")
         return
 
-    batch_files = sorted(BATCH_DIR.glob("batch_*.json"))
+    batch_files = sorted(BATCH_DIR.glob("batch_*.json*"))
     if not batch_files:
         print("No batch files found.")
         return
 
     print(f"Found {len(batch_files)} batch files")
 
-    all_posts = []
+    output_path = Path(args.output) if args.output else OUTPUT_DIR / f"all_comments.{args.format}"
+    total_posts = 0
     total_comments = 0
     status_counts = {}
 
-    for bf in batch_files:
-        with open(bf) as f:
-            batch = json.load(f)
-        for post in batch:
-            all_posts.append(post)
-            total_comments += post["actual_comment_count"]
-            s = post["status"]
-            status_counts[s] = status_counts.get(s, 0) + 1
-
-    output = {
-        "total_posts": len(all_posts),
-        "total_comments": total_comments,
-        "status_summary": status_counts,
-        "posts": all_posts,
-    }
-
-    output_path = Path(args.output)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-
-    print(f"\nMerged {len(all_posts):,} posts with {total_comments:,} comments")
+    workers = args.workers or os.cpu_count() or 1
+
+    with open(output_path, "wb") as out, ProcessPoolExecutor(max_workers=workers) as ex:
+        if args.format == "json":
+            out.write(b'{"posts":[')
+
+        # First pass: index of the newest batch holding each post
+        latest_batch = {}
+        for i, post_ids in enumerate(iter_batches(ex, read_post_ids, batch_files, 2 * workers)):
+            for post_id in post_ids:
+                latest_batch[post_id] = i
+
+        # Second pass in batch order; a post is written only from its newest
+        # batch, and only once
+        for i, batch in enumerate(iter_batches(ex, encode_batch, batch_files, 2 * workers)):
+            for post_id, status, comment_count, encoded in batch:
+                if latest_batch.get(post_id) != i:
+                    continue
+                del latest_batch[post_id]
+
+                if args.format == "json":
+                    if total_posts:
+                        out.write(b",")
+                    out.write(encoded)
+                else:
+                    out.write(encoded + b"\n")
+
+                total_posts += 1
+                total_comments += comment_count
+                status_counts[status] = status_counts.get(status, 0) + 1
+
+        summary = {
+            "total_posts": total_posts,
+            "total_comments": total_comments,
+            "status_summary": status_counts,
+        }
+
+        if args.format == "json":
+            # Totals are only known after streaming the posts, so they follow
+            # the array: close it and splice in the summary's members.
+            out.write(b"]," + orjson.dumps(summary)[1:])
+
+    if args.format == "jsonl":
+        summary_path(output_path).write_bytes(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+
+    print(f"\nMerged {total_posts:,} posts with {total_comments:,} comments")
     print(f"Status breakdown: {json.dumps(status_counts, indent=2)}")
     print(f"Saved to: {output_path}")
+    if args.format == "jsonl":
+        print(f"Summary:  {summary_path(output_path)}")
 
 
 if __name__ == "__main__":